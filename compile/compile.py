@@ -1,11 +1,19 @@
 from dis import Instruction
 import io
+import os
+import sys
+import json
+import hashlib
+import shutil
+import tempfile
 import collections
+import functools
 import operator
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Iterator, Optional
 
 import ppci.lang.python
 import ppci.opt
+import ppci.irutils
 from ppci import ir
 
 from sentence import Atom, Disjunction, Conjunction, Implication, Iff, Negation, Sentence
@@ -55,105 +63,231 @@ for statement in pi(10, 1, 0, 1, 1, 3, 3):
 MAX_INT = 2  # ha ha ha
 
 
+BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "//": operator.floordiv,
+}
+
+COMPARISON_OPERATORS = {
+    "==": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "!=": operator.ne,
+}
+
+
 def binary_operator(s: str) -> Callable:
     """Get a function from a string such as "+" or "*". """
-    if s == "+":
-        return operator.add
-    elif s == "-":
-        return operator.sub
-    elif s == "*":
-        return operator.mul
-    elif s == "/":
-        return operator.truediv
-    elif s == "//":
-        return operator.floordiv
-    else:
+    try:
+        return BINARY_OPERATORS[s]
+    except KeyError:
         raise Exception("unknown binary operator: {}".format(s))
 
 
 def comparison_operator(s: str) -> Callable[[int, int], bool]:
-    if s == "==":
-        return operator.eq
-    elif s == "<":
-        return operator.lt
-    elif s == ">":
-        return operator.gt
-    elif s == ">=":
-        return operator.ge
-    elif s == "<=":
-        return operator.le
-    elif s == "!=":
-        return operator.ne
-    else:
+    try:
+        return COMPARISON_OPERATORS[s]
+    except KeyError:
         raise Exception("unknown comparison operator: {}".format(s))
 
 
+@functools.lru_cache(maxsize=None)
+def binop_table(op: Callable, lhs_values: tuple, rhs_values: tuple, result_values: tuple) -> list[tuple[int, int, int]]:
+    """
+    Get the index triples (i, j, k) such that op(lhs_values[i], rhs_values[j])
+    equals result_values[k]. The table only depends on the operator and the
+    possible values, which are the same for every integer variable, so it is
+    computed once per operator and shared by all binops.
+    """
+    result_index = {value: k for k, value in enumerate(result_values)}
+    table = []
+    for i, vlhs in enumerate(lhs_values):
+        for j, vrhs in enumerate(rhs_values):
+            try:
+                vres = op(vlhs, vrhs)
+            except ZeroDivisionError:
+                continue
+            # results outside the range of the result variable have no atom
+            k = result_index.get(vres)
+            if k is not None:
+                table.append((i, j, k))
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def comparison_table(condition: Callable[[int, int], bool], lhs_values: tuple, rhs_values: tuple) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+    """
+    Get the index pairs (i, j) for which condition(lhs_values[i],
+    rhs_values[j]) holds, and the index pairs for which it does not. Like
+    binop_table, this is computed once per condition and shared by all
+    conditional jumps.
+    """
+    yes = []
+    no = []
+    for i, vlhs in enumerate(lhs_values):
+        for j, vrhs in enumerate(rhs_values):
+            if condition(vlhs, vrhs):
+                yes.append((i, j))
+            else:
+                no.append((i, j))
+    return yes, no
+
+
+# a clause is a tuple of non-zero atom ids, in which n means "atom n is true"
+# and -n means "atom n is false", as in the DIMACS format
+Clause = tuple[int, ...]
+
+
 class SentenceBackend(object):
+    """
+    Translates IR operations into clauses. Each atom is given an integer id
+    when it is created, and each operation generates the clauses that
+    describe it. A clause holds if any of its literals holds.
+
+    The clauses are generated lazily so that they can be streamed out as the
+    IR is walked, but atoms are always created eagerly, so later operations
+    can refer to a variable even before its clauses have been consumed.
+    """
     def __init__(self):
-        self.possible_values = {}  # map from var to list of values
-        self.atoms = {}            # map from (var, value) to Atom
-        self.branch_atoms = {}
-        self.sentences = []
+        self.possible_values = {}  # map from var to tuple of values
+        self.value_index = {}      # map from var to dict from value to its position in possible_values[var]
+        self.atoms = {}            # map from (var, value) to atom id
+        self.atoms_by_var = {}     # map from var to list of atom ids, parallel to possible_values[var]
+        self.branch_atoms = {}     # map from branch to atom id
+        self.atom_table = []       # the Atom with id n is atom_table[n-1]
+
+    def new_atom(self, label: str) -> int:
+        self.atom_table.append(Atom(label))
+        return len(self.atom_table)
+
+    def to_sentence(self, clause: Clause) -> Sentence:
+        """Convert a clause to a sentence, for printing."""
+        literals = []
+        for literal in clause:
+            atom = self.atom_table[abs(literal)-1]
+            literals.append(atom if literal > 0 else Negation(atom))
+        if len(literals) == 1:
+            return literals[0]
+        return Disjunction(*literals)
+
+    def write_dimacs(self, path: str, clauses: Iterator[Clause]) -> None:
+        """Write clauses to a file in DIMACS CNF format, for a SAT solver."""
+        # the header comes before the clauses but the counts are only known
+        # once all of them have been generated, so stream the clauses to a
+        # temporary file first. Nothing is written to path unless all of the
+        # clauses are generated without error.
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.TemporaryFile("w+", dir=directory) as body:
+            num_clauses = 0
+            for clause in clauses:
+                body.write(" ".join(str(literal) for literal in clause) + " 0\n")
+                num_clauses += 1
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    # comment lines record the label of each atom id
+                    for i, atom in enumerate(self.atom_table):
+                        f.write("c {} {}\n".format(i+1, atom))
+                    f.write("p cnf {} {}\n".format(len(self.atom_table), num_clauses))
+                    body.seek(0)
+                    shutil.copyfileobj(body, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
 
     def create_branch(self, branch: str) -> None:
-        self.branch_atoms[branch] = Atom(branch)
+        self.branch_atoms[branch] = self.new_atom(branch)
 
-    def create_var(self, var: str, possible_values: list[Any]) -> None:
+    def create_var(self, var: str, possible_values: list[Any]) -> Iterator[Clause]:
+        # store the values as a tuple so that they can key the operator tables
+        possible_values = tuple(possible_values)
         self.possible_values[var] = possible_values
-        for value in possible_values:
-            a = Atom("{}_{}".format(var, value))
+        self.value_index[var] = {value: i for i, value in enumerate(possible_values)}
+        atoms = [self.new_atom("{}_{}".format(var, value)) for value in possible_values]
+        self.atoms_by_var[var] = atoms
+        for value, a in zip(possible_values, atoms):
             self.atoms[(var, value)] = a
-
-    def create_int(self, var:str) -> None:
-        self.create_var(var, range(-MAX_INT, MAX_INT+1))
-
-    def assign_constant(self, var: str, value: Any) -> None:
-        for v in self.possible_values[var]:
-            a = self.atoms[var, v]
-            if v == value:
-                self.sentences.append(a)
-
-    def assign(self, out: str, inp: str, branch: Optional[str] = None) -> None:
-        for vout in self.possible_values[out]:
-            aout = self.atoms[(out, vout)]
-            for vin in self.possible_values[inp]:
-                ain = self.atoms[(inp, vin)]
-                if vout == vin:
-                    sentence = Iff(aout, ain)
-                    if branch is None:
-                        self.sentences.append(sentence)
-                    else:
-                        self.sentences.append(Implication(branch, sentence))
+        return self.at_most_one(atoms)
+
+    def create_int(self, var:str) -> Iterator[Clause]:
+        return self.create_var(var, range(-MAX_INT, MAX_INT+1))
+
+    def at_most_one(self, atoms: list[int]) -> Iterator[Clause]:
+        # a variable takes at most one value, so that setting one of its atoms
+        # lets a solver propagate the negation of all the others. There is no
+        # "at least one" clause because values outside the representable range
+        # leave every atom false.
+        for i, a in enumerate(atoms):
+            for b in atoms[i+1:]:
+                yield (-a, -b)
+
+    def assign_constant(self, var: str, value: Any) -> Iterator[Clause]:
+        # the atom for the constant is true and the atoms for all other values
+        # are false, so a constant outside the range of var leaves none true
+        i = self.value_index[var].get(value)
+        for j, a in enumerate(self.atoms_by_var[var]):
+            if j == i:
+                yield (a,)
+            else:
+                yield (-a,)
+
+    def assign(self, out: str, inp: str, branch: Optional[str] = None) -> Iterator[Clause]:
+        # only equal values of out and inp produce a clause, so look up the
+        # matching input atom for each output value rather than scanning all pairs
+        inp_index = self.value_index[inp]
+        inp_atoms = self.atoms_by_var[inp]
+        for vout, aout in zip(self.possible_values[out], self.atoms_by_var[out]):
+            i = inp_index.get(vout)
+            if i is None:
+                continue
+            ain = inp_atoms[i]
+            # aout <-> ain is the pair of clauses (¬aout ∨ ain) and (aout ∨ ¬ain)
+            if branch is None:
+                yield (-aout, ain)
+                yield (aout, -ain)
+            else:
+                abranch = self.branch_atoms[branch]
+                yield (-abranch, -aout, ain)
+                yield (-abranch, aout, -ain)
     
 
-    def conditional_jump(self, lhs: str, rhs: str, condition: Callable[[int, int], bool], yesbranch: str, nobranch: str) -> None:
+    def conditional_jump(self, lhs: str, rhs: str, condition: Callable[[int, int], bool], yesbranch: str, nobranch: str) -> Iterator[Clause]:
         """
-        Creates sentences to represent the fact that if the condition holds then we go to
+        Generates clauses to represent the fact that if the condition holds then we go to
         "yesbranch", otherwise we go to "nobranch"
         """
+        yes, no = comparison_table(
+            condition,
+            self.possible_values[lhs],
+            self.possible_values[rhs])
+        lhs_atoms = self.atoms_by_var[lhs]
+        rhs_atoms = self.atoms_by_var[rhs]
+        # (alhs ∧ arhs) → branch is the clause (¬alhs ∨ ¬arhs ∨ branch)
         ayes = self.branch_atoms[yesbranch]
+        for i, j in yes:
+            yield (-lhs_atoms[i], -rhs_atoms[j], ayes)
         ano = self.branch_atoms[nobranch]
-        for vlhs in self.possible_values[lhs]:
-            alhs = self.atoms[(lhs, vlhs)]
-            for vrhs in self.possible_values[rhs]:
-                arhs = self.atoms[(rhs, vrhs)]
-                if condition(vlhs, vrhs):
-                    self.sentences.append(Implication(Conjunction(alhs, arhs), ayes))
-                else:
-                    self.sentences.append(Implication(Conjunction(alhs, arhs), ano))
-
-    def binop(self, result: str, lhs: str, rhs: str, op: Callable) -> None:
-        for vres in self.possible_values[result]:
-            ares = self.atoms[(result, vres)]
-            for vlhs in self.possible_values[lhs]:
-                alhs = self.atoms[(lhs, vlhs)]
-                for vrhs in self.possible_values[rhs]:
-                    arhs = self.atoms[(rhs, vrhs)]
-                    try:
-                        if vres == op(vlhs, vrhs):
-                            self.sentences.append(Implication(Conjunction(alhs, arhs), ares))
-                    except ZeroDivisionError as e:
-                        pass
+        for i, j in no:
+            yield (-lhs_atoms[i], -rhs_atoms[j], ano)
+
+    def binop(self, result: str, lhs: str, rhs: str, op: Callable) -> Iterator[Clause]:
+        table = binop_table(
+            op,
+            self.possible_values[lhs],
+            self.possible_values[rhs],
+            self.possible_values[result])
+        lhs_atoms = self.atoms_by_var[lhs]
+        rhs_atoms = self.atoms_by_var[rhs]
+        result_atoms = self.atoms_by_var[result]
+        for i, j, k in table:
+            yield (-lhs_atoms[i], -rhs_atoms[j], result_atoms[k])
 
 
 def mod_name(mod: ir.Module) -> str:
@@ -181,9 +315,16 @@ def instr_name(instr: ir.Instruction) -> str:
     return block_name(instr.block) + "__" + instr.name
 
 
-def main():
-    m = ppci.lang.python.python_to_ir(io.StringIO(src))
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
 
+
+def optimized_ir(src: str) -> ir.Module:
+    """
+    Compile python source to IR and run the optimization passes over it. The
+    result is cached on disk, keyed by a hash of the source, the passes, and
+    the version of ppci, so that unchanged programs are not recompiled on every
+    run.
+    """
     passes = [
         ppci.opt.Mem2RegPromotor(),
         ppci.opt.LoadAfterStorePass(),
@@ -192,14 +333,42 @@ def main():
         ppci.opt.CommonSubexpressionEliminationPass(),
     ]
 
+    h = hashlib.blake2b(src.encode())
+    h.update(ppci.__version__.encode())
     for p in passes:
-        p.run(m)
+        h.update(type(p).__name__.encode())
+    path = os.path.join(CACHE_DIR, h.hexdigest() + ".json")
 
-    func = m.functions[0]
-    func.dump()
+    if os.path.exists(path):
+        with open(path) as f:
+            return ppci.irutils.from_json(json.load(f))
 
-    be = SentenceBackend()
+    m = ppci.lang.python.python_to_ir(io.StringIO(src))
+    for p in passes:
+        p.run(m)
 
+    # IR modules do not pickle, but ppci can round-trip them through json. Write
+    # to a temporary file and then rename it, so that an interrupted or
+    # concurrent run never leaves a partial file at the cached path.
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(ppci.irutils.to_json(m), f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return m
+
+
+def compile_function(be: SentenceBackend, func: ir.Function) -> Iterator[Clause]:
+    """
+    Walk the IR for a function and generate the clauses that describe it. The
+    clauses are generated as each instruction is visited, so that they can be
+    streamed out without holding all of them in memory.
+    """
     def value_name(v: ir.LocalValue) -> str:
         if isinstance(v, ir.Parameter):
             return func_name(func) + "__arg__" + v.name
@@ -210,7 +379,7 @@ def main():
 
 
     if func.return_ty.is_integer:
-        be.create_int(output_name(func))
+        yield from be.create_int(output_name(func))
     else:
         raise Exception("unsupported function type: {}".format(func.return_ty))
 
@@ -219,7 +388,7 @@ def main():
 
     for arg in func.arguments:
         if arg.ty.is_integer:
-            be.create_int(value_name(arg))
+            yield from be.create_int(value_name(arg))
         else:
             raise Exception("unsupported argument type: {}".format(instr.ty))
 
@@ -227,10 +396,10 @@ def main():
         for instr in block.instructions:
             # name of the output of this instruction
             if isinstance(instr, ir.Return):
-                be.assign(output_name(func), value_name(instr.result))
+                yield from be.assign(output_name(func), value_name(instr.result))
 
             if isinstance(instr, ir.CJump):
-                be.conditional_jump(
+                yield from be.conditional_jump(
                     lhs=value_name(instr.a),
                     rhs=value_name(instr.b),
                     condition=comparison_operator(instr.cond),
@@ -240,16 +409,16 @@ def main():
             elif isinstance(instr, ir.LocalValue):
                 # this is an instruction that has a type
                 if instr.ty.is_integer:
-                    be.create_int(instr_name(instr))
+                    yield from be.create_int(instr_name(instr))
                 else:
                     raise Exception("unsupported type: {}".format(instr.ty))
 
                 if isinstance(instr, ir.Const):
-                    be.assign_constant(value_name(instr), instr.value)
+                    yield from be.assign_constant(value_name(instr), instr.value)
 
                 elif isinstance(instr, ir.Binop):
                     print("performing binop on {} and {} -> {}")
-                    be.binop(
+                    yield from be.binop(
                         instr_name(instr),
                         value_name(instr.a),
                         value_name(instr.b),
@@ -258,7 +427,7 @@ def main():
                 elif isinstance(instr, ir.Phi):
                     # a phi is a map from blocks to the values used if that block was executed
                     for block, value in instr.inputs.items():
-                        be.assign(
+                        yield from be.assign(
                             instr_name(instr),
                             value_name(value),
                             branch=branch_name(block)
@@ -269,8 +438,22 @@ def main():
 
     # TODO: simple if statement
 
-    for s in be.sentences:
-        print(s)
+
+def main():
+    m = optimized_ir(src)
+
+    func = m.functions[0]
+    func.dump()
+
+    be = SentenceBackend()
+    clauses = compile_function(be, func)
+
+    # either hand the clauses off to a SAT solver or print them
+    if len(sys.argv) > 1:
+        be.write_dimacs(sys.argv[1], clauses)
+    else:
+        for clause in clauses:
+            print(be.to_sentence(clause))
 
 
 if __name__ == "__main__":
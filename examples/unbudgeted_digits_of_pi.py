@@ -26,7 +26,7 @@ def sum_trading_formulae(formulae):
             terms_by_sentence[sentence].append(expr)
 
     return {
-        sentence: formula.Sum(*terms)
+        sentence: formula.simplified_sum(*terms)
         for sentence, terms in terms_by_sentence.items()
     }
 
@@ -1,25 +1,64 @@
-
 class History(object):
     """Represents a sequence of belief states."""
 
-    def __init__(self, credences=[]):
+    def __init__(self, credences=None, length=None):
+        # The list of credences may be shared with other histories that
+        # extend this one, so this history only looks at the first
+        # self._length entries.
+        if length is None:
+            credences = list(credences) if credences is not None else []
+            length = len(credences)
         self._credences = credences
+        self._length = length
+        # whether the last update may be replaced in place, in which case no
+        # other history may share the list of credences
+        self._scratch = False
 
     def lookup(self, sentence, day):
-        assert 1 <= day and day <= len(self._credences), \
+        assert 1 <= day and day <= self._length, \
             "day index should be in [1, {}] but got {}".format(
-                len(self._credences), day)
+                self._length, day)
         return self._credences[day-1].get(sentence, 0.)
 
     def price(self, sentence):
         """Price gets the current price for the given sentence."""
-        return self._credences[-1].get(sentence, 0.)
+        return self.last_update().get(sentence, 0.)
 
     def with_next_update(self, next_credences):
-        return History(self._credences + [next_credences])
+        # if no other history has extended the shared list then extend it in
+        # place, which avoids copying the whole list on every update. A scratch
+        # history is always copied, since its last update may still change.
+        if len(self._credences) == self._length and not self._scratch:
+            self._credences.append(next_credences)
+            return History(self._credences, self._length+1)
+        else:
+            return History(self._credences[:self._length] + [next_credences])
+
+    def with_scratch_update(self):
+        """
+        Returns a copy of this history extended by one empty update. The copy
+        does not share its list of credences with any other history, so its
+        last update may be changed in place with replace_last_update, and
+        histories that extend it copy the list rather than share it.
+        """
+        history = History(self._credences[:self._length] + [{}])
+        history._scratch = True
+        return history
+
+    def replace_last_update(self, credences):
+        """Replaces the last update. Only use this on a history from with_scratch_update."""
+        assert self._scratch, "only a history from with_scratch_update may be changed in place"
+        self._credences[self._length-1] = credences
+
+    def converted(self, convert):
+        """Returns a copy of this history with convert applied to each update."""
+        return History([convert(credences) for credences in self._credences[:self._length]])
 
     def last_update(self):
-        return self._credences[-1]
+        # check explicitly since the shared list may be longer than this history
+        if self._length == 0:
+            raise IndexError("history is empty")
+        return self._credences[self._length-1]
 
     def __len__(self):
-        return len(self._credences)
\ No newline at end of file
+        return self._length
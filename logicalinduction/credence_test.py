@@ -0,0 +1,49 @@
+from .credence import History
+
+
+def test_with_next_update():
+    h0 = History()
+    h1 = h0.with_next_update({1: .5})
+    h2 = h1.with_next_update({1: .6})
+    assert len(h0) == 0
+    assert len(h1) == 1
+    assert len(h2) == 2
+    assert h1.price(1) == .5
+    assert h2.price(1) == .6
+    assert h2.lookup(1, 1) == .5
+
+
+def test_with_next_update_branching():
+    h1 = History([{1: .5}])
+    a = h1.with_next_update({1: .1})
+    b = h1.with_next_update({1: .9})
+
+    # extending the same history twice must not affect the first extension
+    assert a.price(1) == .1
+    assert b.price(1) == .9
+    assert a.with_next_update({1: .2}).lookup(1, 2) == .1
+    assert b.with_next_update({1: .8}).lookup(1, 2) == .9
+    assert h1.price(1) == .5
+
+
+def test_with_scratch_update():
+    h1 = History([{1: .5}])
+    scratch = h1.with_scratch_update()
+    scratch.replace_last_update({1: .7})
+    assert scratch.price(1) == .7
+    assert scratch.lookup(1, 1) == .5
+
+    # the scratch history must not be visible to extensions of the original
+    assert h1.with_next_update({1: .2}).price(1) == .2
+    assert len(h1) == 1
+
+
+def test_extend_scratch_update():
+    scratch = History([{1: .5}]).with_scratch_update()
+    scratch.replace_last_update({1: .7})
+    h3 = scratch.with_next_update({1: .1})
+
+    # replacing the scratch update must not affect histories that extend it
+    scratch.replace_last_update({1: .9})
+    assert h3.lookup(1, 2) == .7
+    assert scratch.price(1) == .9
@@ -4,51 +4,86 @@ from fractions import Fraction
 
 def integers(start=0, step=1):
     """Enumerates non-negative integers."""
-    i = start
-    while True:
-        yield i
-        i += step
+    # itertools.count is a C iterator, so it avoids resuming a generator frame
+    # for every integer
+    return itertools.count(start, step)
 
 
 def integer_vectors(length, start=0, step=1):
     """Enumerates vectors of integers of the given length."""
-    for balls in integers():
-        yield from allocations_of(balls, length)
+    return itertools.chain.from_iterable(
+        allocations_of(balls, length) for balls in integers())
 
 
 def rationals_between(a, b):
     """Enumerate rationals between the given lower and upper bounds."""
+    for numer, denom in unit_rational_pairs():
+        yield a + (b-a) * Fraction(numer, denom)
+
+
+def unit_rational_pairs():
+    """Enumerates rationals in [0, 1] as (numerator, denominator) pairs, which
+    are not reduced to lowest terms."""
     for denom in integers(start=1):
         for numer in range(0, denom+1):
-            yield a + (b-a) * Fraction(numer, denom)
+            yield (numer, denom)
 
 
 def nonnegative_rationals():
-    """Enumerates positive rationals."""
-    yield Fraction(0, 1)  # zero is a special case that will not be yielded by the loop below
-    for n in integers():
-        for denom in range(1, n):
-            yield Fraction(n-denom, denom)
+    """Enumerates non-negative rationals, each exactly once."""
+    for numer, denom in nonnegative_rational_pairs():
+        yield Fraction(numer, denom)
+
+
+def nonnegative_rational_pairs():
+    """Enumerates non-negative rationals as (numerator, denominator) pairs in
+    lowest terms, each exactly once. This is cheaper than nonnegative_rationals
+    for callers that only need some of the rationals as Fractions."""
+    yield (0, 1)  # zero is a special case that will not be yielded by the loop below
+
+    # walk the Calkin-Wilf sequence 1/1, 1/2, 2/1, 1/3, 3/2, ..., in which
+    # every positive rational appears exactly once and in lowest terms
+    numer, denom = 1, 1
+    while True:
+        yield (numer, denom)
+        numer, denom = denom, 2 * (numer // denom) * denom + denom - numer
 
 
 def allocations_of(balls, jars):
     """Enumerates the ways to divide N identical balls among K jars.
     Returns a sequence of tuples, each of which contains K integers
-    that add up to N."""
-    if jars == 1:
-        # base case: there is only one way to divide N balls among 1 jar
-        yield (balls,)
-    else:
-        for i in range(balls+1):
-            for sub in allocations_of(balls-i, jars-1):
-                yield (i,) + sub
+    that add up to N. The tuples are generated in lexicographic order."""
+    # start with all the balls in the last jar
+    allocation = [0] * jars
+    allocation[-1] = balls
+    while True:
+        yield tuple(allocation)
+
+        # find the last non-empty jar
+        last = jars - 1
+        while last > 0 and allocation[last] == 0:
+            last -= 1
+
+        # once all the balls are in the first jar we are done
+        if last == 0:
+            return
+
+        # move one ball from the last non-empty jar into the jar before it,
+        # and move the rest of its balls into the last jar
+        remaining = allocation[last] - 1
+        allocation[last] = 0
+        allocation[last-1] += 1
+        allocation[-1] = remaining
 
 
 def product(xs, length):
     """Enumerates the cartesian product of X with itself N times.
     Unlike itertools.product, this works when X is an infinite sequence."""
     cache = []
+    lookup = cache.__getitem__
     for i, x in enumerate(xs):
         cache.append(x)
         for js in allocations_of(i, length):
-            yield tuple(list(cache[j] for j in js))
+            # build each tuple directly from the cache rather than via an
+            # intermediate generator and list
+            yield tuple(map(lookup, js))
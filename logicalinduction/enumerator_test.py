@@ -1,6 +1,8 @@
 import itertools
+from fractions import Fraction
 
-from .enumerator import integer_vectors, product
+from .enumerator import integer_vectors, product, allocations_of
+from .enumerator import nonnegative_rationals, nonnegative_rational_pairs
 
 
 def test_integer_vectors():
@@ -30,3 +32,28 @@ def test_product():
     assert ''.join(next(it)) == 'bc'
     assert ''.join(next(it)) == 'cb'
     assert ''.join(next(it)) == 'da'
+
+
+def test_allocations_of():
+    assert list(allocations_of(0, 3)) == [(0, 0, 0)]
+    assert list(allocations_of(2, 1)) == [(2,)]
+    assert list(allocations_of(2, 3)) == [
+        (0, 0, 2),
+        (0, 1, 1),
+        (0, 2, 0),
+        (1, 0, 1),
+        (1, 1, 0),
+        (2, 0, 0),
+    ]
+
+
+def test_nonnegative_rational_pairs():
+    pairs = list(itertools.islice(nonnegative_rational_pairs(), 8))
+    assert pairs == [(0, 1), (1, 1), (1, 2), (2, 1), (1, 3), (3, 2), (2, 3), (3, 1)]
+    assert list(itertools.islice(nonnegative_rationals(), 8)) == [Fraction(*p) for p in pairs]
+
+
+def test_nonnegative_rationals_are_distinct():
+    rationals = list(itertools.islice(nonnegative_rationals(), 1000))
+    assert len(set(rationals)) == len(rationals)
+    assert all(Fraction(1, d) in rationals for d in range(1, 10))
@@ -1,7 +1,6 @@
+import math
 from abc import ABC, abstractmethod
-from operator import mul
-from typing import Iterator, Protocol, Iterable
-from functools import reduce
+from typing import Any, Callable, Optional, Protocol, Iterable
 from fractions import Fraction
 
 from .sentence import Sentence
@@ -13,6 +12,8 @@ class Number(Protocol):
         ...
     def __mul__(self, Number) -> 'Number':
         ...
+    def __rmul__(self, Number) -> 'Number':
+        ...
     def __add__(self, Number) -> 'Number':
         ...
     def __lt__(self, Number) -> bool:
@@ -25,10 +26,12 @@ class Number(Protocol):
         ...
 
 
-def multiply(xs: Iterator[Number]) -> Number:
-    """Compute the product of the elements of a list, or return None if the list
+def multiply(xs: Iterable[Number]) -> Number:
+    """Compute the product of the elements of a list, or return 1 if the list
     is empty."""
-    return reduce(mul, xs)
+    # math.prod multiplies from left to right starting from 1, which gives
+    # the same result as reduce(mul, xs) for any non-empty list
+    return math.prod(xs)
 
 
 def parenthize(formula: 'Formula'):
@@ -54,7 +57,13 @@ class Formula(ABC):
     credences, returning a number. It has an upper bounded, which is its
     greatest possible magnitude (assuming credences are between 0 and 1). It has
     a domain, which is the set of sentences upon whose credence it depends.
+    Formulas are immutable, so the bound and domain of a formula are computed
+    once and then reused, which matters because sub-formulas are often shared.
+    Trading formulas are built from many small nodes, so each class declares
+    __slots__ rather than carrying a per-instance __dict__.
     """
+    __slots__ = ()
+
     @abstractmethod
     def evaluate(self, credence_history: History) -> Number:
         """
@@ -62,6 +71,23 @@ class Formula(ABC):
         """
         pass
 
+    def compile(self) -> Callable[[History], Number]:
+        """
+        Get a function that computes the same value as evaluate. See
+        compile_formulas.
+        """
+        evaluate_all = compile_formulas([self])
+        return lambda credence_history: evaluate_all(credence_history)[0]
+
+    @abstractmethod
+    def emit(self, compiler: 'Compiler') -> str:
+        """
+        Get a Python expression that computes the value of this formula, for
+        use by compile_formulas. The expression refers to the values of
+        sub-formulas through the names returned by compiler.value.
+        """
+        pass
+
     @abstractmethod
     def bound(self) -> Number:
         """
@@ -71,7 +97,7 @@ class Formula(ABC):
         pass
 
     @abstractmethod
-    def domain(self) -> set[Sentence]:
+    def domain(self) -> frozenset[Sentence]:
         """
         Get the sentences whose price will be used in the
         evaluation of this formula.
@@ -88,19 +114,27 @@ class Formula(ABC):
 
 class Constant(Formula):
     """
-    Represents a constant trading formula.
+    Represents a constant trading formula. The domain is empty unless the
+    constant stands in for formulas that were simplified away, as in
+    simplified_product, in which case it is the domain of those formulas.
     """
-    def __init__(self, k: Number):
+    __slots__ = ('k', '_domain')
+
+    def __init__(self, k: Number, domain: frozenset[Sentence] = frozenset()):
         self.k = k
+        self._domain = domain
 
     def evaluate(self, credence_history: History) -> Number:
         return self.k
 
+    def emit(self, compiler: 'Compiler') -> str:
+        return compiler.constant(self.k)
+
     def bound(self) -> Number:
         return abs(self.k)
 
-    def domain(self) -> set[Sentence]:
-        return set()
+    def domain(self) -> frozenset[Sentence]:
+        return self._domain
 
     def tree(self) -> str:
         return "Constant({})".format(str(self.k))
@@ -116,19 +150,25 @@ class Price(Formula):
     """
     Looks up the price for a given sentence on a given update.
     """
+    __slots__ = ('sentence', 'update_index', '_domain')
+
     def __init__(self, sentence: Sentence, update_index: int):
         assert(update_index >= 1)  # indices are 1-based
         self.sentence = sentence
         self.update_index = update_index
+        self._domain = frozenset([sentence])
 
     def evaluate(self, credence_history: History) -> Number:
         return credence_history.lookup(self.sentence, self.update_index)
 
+    def emit(self, compiler: 'Compiler') -> str:
+        return compiler.lookup(self.sentence, self.update_index)
+
     def bound(self) -> Number:
         return Fraction(1, 1)   # because credences are always between 0 and 1
 
-    def domain(self) -> set[Sentence]:
-        return {self.sentence}
+    def domain(self) -> frozenset[Sentence]:
+        return self._domain
 
     def tree(self) -> str:
         return "Price({}, {})".format(self.sentence, self.update_index)
@@ -144,17 +184,33 @@ class Sum(Formula):
     """
     Represents a sum of trading formulas.
     """
+    __slots__ = ('terms', '_domain', '_bound')
+
     def __init__(self, *terms: Formula):
-        self.terms = list(terms)
+        # terms is already a tuple, and formulas are immutable, so keep it as is
+        self.terms = terms
+        self._domain: Optional[frozenset[Sentence]] = None
+        self._bound: Optional[Number] = None
 
     def evaluate(self, credence_history: History) -> Number:
-        return sum(term.evaluate(credence_history) for term in self.terms)
+        # materialize the values rather than consuming a generator, but still
+        # call sum so that floats are added exactly as compiled formulas add them
+        return sum([term.evaluate(credence_history) for term in self.terms])
+
+    def emit(self, compiler: 'Compiler') -> str:
+        # call sum rather than chaining "+" so that floats are added exactly
+        # as evaluate adds them
+        return "sum([{}])".format(", ".join(compiler.value(term) for term in self.terms))
 
     def bound(self) -> Number:
-        return sum(term.bound() for term in self.terms)
+        if self._bound is None:
+            self._bound = sum(term.bound() for term in self.terms)
+        return self._bound
 
-    def domain(self) -> set[Sentence]:
-        return set.union(*(term.domain() for term in self.terms))
+    def domain(self) -> frozenset[Sentence]:
+        if self._domain is None:
+            self._domain = frozenset().union(*(term.domain() for term in self.terms))
+        return self._domain
 
     def tree(self) -> str:
         return maketree("Sum", self.terms)
@@ -174,18 +230,32 @@ class Product(Formula):
     """
     Represents a product of trading formulas.
     """
+    __slots__ = ('terms', '_domain', '_bound')
+
     def __init__(self, *terms: Formula):
-        self.terms = list(terms)
+        self.terms = terms
+        self._domain: Optional[frozenset[Sentence]] = None
+        self._bound: Optional[Number] = None
 
     def evaluate(self, credence_history: History) -> Number:
-        return multiply(term.evaluate(credence_history) for term in self.terms)
+        return multiply([term.evaluate(credence_history) for term in self.terms])
+
+    def emit(self, compiler: 'Compiler') -> str:
+        if len(self.terms) == 0:
+            return "multiply([])"
+        # this multiplies from left to right, just like multiply
+        return " * ".join(compiler.value(term) for term in self.terms)
 
     def bound(self) -> Number:
         # bounds are always >= 0 so we can multiply them safely
-        return multiply(term.bound() for term in self.terms)
+        if self._bound is None:
+            self._bound = multiply(term.bound() for term in self.terms)
+        return self._bound
 
-    def domain(self) -> set[Sentence]:
-        return set.union(*(term.domain() for term in self.terms))
+    def domain(self) -> frozenset[Sentence]:
+        if self._domain is None:
+            self._domain = frozenset().union(*(term.domain() for term in self.terms))
+        return self._domain
 
     def tree(self) -> str:
         return maketree("Product", self.terms)
@@ -205,17 +275,30 @@ class Max(Formula):
     """
     Represents a max over trading formulas.
     """
+    __slots__ = ('terms', '_domain', '_bound')
+
     def __init__(self, *terms: Formula):
-        self.terms = list(terms)
+        self.terms = terms
+        self._domain: Optional[frozenset[Sentence]] = None
+        self._bound: Optional[Number] = None
 
     def evaluate(self, credence_history: History) -> Number:
-        return max(term.evaluate(credence_history) for term in self.terms)
+        return max([term.evaluate(credence_history) for term in self.terms])
+
+    def emit(self, compiler: 'Compiler') -> str:
+        if len(self.terms) == 1:
+            return compiler.value(self.terms[0])
+        return "max([{}])".format(", ".join(compiler.value(term) for term in self.terms))
 
     def bound(self) -> Number:
-        return max(term.bound() for term in self.terms)
+        if self._bound is None:
+            self._bound = max(term.bound() for term in self.terms)
+        return self._bound
 
-    def domain(self) -> set[Sentence]:
-        return set.union(*(term.domain() for term in self.terms))
+    def domain(self) -> frozenset[Sentence]:
+        if self._domain is None:
+            self._domain = frozenset().union(*(term.domain() for term in self.terms))
+        return self._domain
 
     def tree(self) -> str:
         return maketree("Max", self.terms)
@@ -236,17 +319,30 @@ class Min(Formula):
     """
     Represents a min over trading formulas.
     """
-    def __init__(self, *terms):
-        self.terms = list(terms)
+    __slots__ = ('terms', '_domain', '_bound')
+
+    def __init__(self, *terms: Formula):
+        self.terms = terms
+        self._domain: Optional[frozenset[Sentence]] = None
+        self._bound: Optional[Number] = None
 
     def evaluate(self, credence_history: History) -> Number:
-        return min(term.evaluate(credence_history) for term in self.terms)
+        return min([term.evaluate(credence_history) for term in self.terms])
+
+    def emit(self, compiler: 'Compiler') -> str:
+        if len(self.terms) == 1:
+            return compiler.value(self.terms[0])
+        return "min([{}])".format(", ".join(compiler.value(term) for term in self.terms))
 
     def bound(self) -> Number:
-        return min(term.bound() for term in self.terms)
+        if self._bound is None:
+            self._bound = min(term.bound() for term in self.terms)
+        return self._bound
 
-    def domain(self) -> set[Sentence]:
-        return set.union(*(term.domain() for term in self.terms))
+    def domain(self) -> frozenset[Sentence]:
+        if self._domain is None:
+            self._domain = frozenset().union(*(term.domain() for term in self.terms))
+        return self._domain
 
     def tree(self) -> str:
         return maketree("Min", self.terms)
@@ -267,16 +363,21 @@ class SafeReciprocal(Formula):
     """
     Represents 1 / max(1, x) where x is a trading formula.
     """
+    __slots__ = ('x',)
+
     def __init__(self, x: Formula):
         self.x = x
 
     def evaluate(self, credence_history: History) -> Number:
         return 1. / max(1., self.x.evaluate(credence_history))
 
+    def emit(self, compiler: 'Compiler') -> str:
+        return "1. / max(1., {})".format(compiler.value(self.x))
+
     def bound(self) -> Number:
         return 1.  # the denominator is always >= 1, so the result is always <= 1
 
-    def domain(self) -> set[Sentence]:
+    def domain(self) -> frozenset[Sentence]:
         return self.x.domain()
 
     def tree(self) -> str:
@@ -287,3 +388,163 @@ class SafeReciprocal(Formula):
 
     def __repr__(self) -> str:
         return str(self)
+
+
+class Compiler(object):
+    """
+    Generates the body of a Python function that evaluates formulas, with one
+    assignment per sub-formula. A sub-formula that appears more than once,
+    which is common in budget formulas, is only evaluated once. This includes
+    sub-formulas that are distinct objects but have the same structure, since
+    they emit the same expression.
+
+    If fixed_updates is N then the caller promises that the first N updates of
+    every credence history passed to the compiled function are the same, so
+    sub-formulas that only look at those updates are evaluated once, when the
+    function is compiled, rather than on every call.
+    """
+    def __init__(self, fixed_updates: int = 0):
+        self.fixed_updates = fixed_updates
+        self.lines: list[str] = []              # assignments evaluated on every call
+        self.fixed_lines: list[str] = []        # assignments evaluated once, at compile time
+        self.names: dict[int, str] = {}         # map from id(formula) to the name holding its value
+        self.formulas: list[Formula] = []       # keep the formulas alive so that their ids stay unique
+        self.expressions: dict[str, str] = {}   # map from emitted expression to the name holding its value
+        self.constants: dict[tuple, str] = {}   # map from constant_key(value) to the name holding it
+        self.varying: dict[str, bool] = {}      # map from name to whether its value varies between calls
+        self.emitting: list[bool] = []          # whether each formula being emitted varies between calls
+        self.namespace: dict[str, Any] = {"multiply": multiply}
+
+    def value(self, formula: Formula) -> str:
+        """Get the name of a variable that holds the value of the given formula."""
+        name = self.names.get(id(formula))
+        if name is None:
+            self.emitting.append(False)
+            expr = formula.emit(self)
+            varying = self.emitting.pop()
+            name = self.expressions.get(expr)
+            if name is None:
+                name = "v{}".format(len(self.expressions))
+                assignment = "{} = {}".format(name, expr)
+                (self.lines if varying else self.fixed_lines).append(assignment)
+                self.expressions[expr] = name
+                self.varying[name] = varying
+            self.names[id(formula)] = name
+            self.formulas.append(formula)
+        if self.varying[name] and self.emitting:
+            self.emitting[-1] = True
+        return name
+
+    def constant(self, value) -> str:
+        """Get the name of a global that holds the given value."""
+        key = constant_key(value)
+        name = self.constants.get(key)
+        if name is None:
+            name = "c{}".format(len(self.namespace))
+            self.namespace[name] = value
+            self.constants[key] = name
+        return name
+
+    def lookup(self, sentence: Sentence, update_index: int) -> str:
+        """Get an expression that looks up the price of a sentence on an update."""
+        if update_index > self.fixed_updates:
+            self.emitting[-1] = True
+        return "credence_history.lookup({}, {})".format(
+            self.constant(sentence), update_index)
+
+    def function(self, formulas: Iterable[Formula], credence_history: Optional[History] = None) -> Callable[[History], list[Number]]:
+        """
+        Compile a function that returns the values of the given formulas. If
+        there are sub-formulas that only look at fixed updates then they are
+        evaluated on credence_history, which must contain those updates.
+        """
+        results = [self.value(formula) for formula in formulas]
+        body = self.lines + ["return [{}]".format(", ".join(results))]
+        if len(self.fixed_lines) == 0:
+            source = "def evaluate_all(credence_history):\n"
+            source += indented(body, "    ")
+            exec(source, self.namespace)
+            return self.namespace["evaluate_all"]
+
+        # evaluate the fixed sub-formulas in an outer function, whose local
+        # variables the inner function can read without recomputing them
+        source = "def prepare(credence_history):\n"
+        source += indented(self.fixed_lines, "    ")
+        source += "    def evaluate_all(credence_history):\n"
+        source += indented(body, "        ")
+        source += "    return evaluate_all\n"
+        exec(source, self.namespace)
+        return self.namespace["prepare"](credence_history)
+
+
+def indented(lines: Iterable[str], indent: str) -> str:
+    """Join lines of source code, indenting each one."""
+    return "".join(indent + line + "\n" for line in lines)
+
+
+def constant_key(value) -> tuple:
+    """
+    Get a key that is equal for two constants only if substituting one for the
+    other cannot change the value of a formula. Numbers are compared by type
+    and repr, which tells 0. apart from -0., and anything else, such as a
+    sentence, is compared by identity.
+    """
+    if isinstance(value, (int, float, Fraction)):
+        return (type(value), repr(value))
+    return (object, id(value))
+
+
+def compile_formulas(formulas: Iterable[Formula], credence_history: Optional[History] = None) -> Callable[[History], list[Number]]:
+    """
+    Get a function that evaluates each of the given formulas on a credence
+    history and returns the list of their values, which are the same as the
+    values returned by evaluate. The formulas are translated into straight-line
+    Python code once, so that calling the function involves no method calls or
+    tree walks, and evaluates each shared sub-formula only once.
+
+    If credence_history is given then the function may only be called on
+    histories that extend it, and sub-formulas that only look at the updates
+    in credence_history are evaluated once, here, rather than on every call.
+    """
+    fixed_updates = len(credence_history) if credence_history is not None else 0
+    return Compiler(fixed_updates).function(formulas, credence_history)
+
+
+def is_constant(formula: Formula, k: Number) -> bool:
+    """Determine whether formula is a constant with value equal to k."""
+    # compare types directly since isinstance goes through ABCMeta, which is
+    # several times slower when the answer is no, as it is for most terms
+    return type(formula) is Constant and formula.k == k
+
+
+def simplified_sum(*terms: Formula) -> Formula:
+    """
+    Construct a formula equal to the sum of the given terms, leaving out any
+    terms that are the constant zero, unless they carry a domain from
+    simplified_product. Nested sums are not flattened because that would
+    change the order in which the terms are added.
+    """
+    nonzero_terms = [term for term in terms if not (is_constant(term, 0) and not term.domain())]
+    if len(nonzero_terms) == 0:
+        return Constant(0)
+    if len(nonzero_terms) == 1:
+        return nonzero_terms[0]
+    return Sum(*nonzero_terms)
+
+
+def simplified_product(*terms: Formula) -> Formula:
+    """
+    Construct a formula equal to the product of the given terms, leaving out
+    any terms that are the constant one, and collapsing to the constant zero if
+    any term is the constant zero. The constant zero keeps the domain of the
+    terms, so that the sentences they look at are still searched over by
+    find_credences, as they would be for the full product.
+    """
+    if any(is_constant(term, 0) for term in terms):
+        return Constant(0, frozenset().union(*(term.domain() for term in terms)))
+    nonunit_terms = [term for term in terms if not is_constant(term, 1)]
+    if len(nonunit_terms) == 0:
+        return Constant(1)
+    if len(nonunit_terms) == 1:
+        return nonunit_terms[0]
+    return Product(*nonunit_terms)
@@ -0,0 +1,68 @@
+from .credence import History
+from .formula import Price, Sum, Constant, Product, Max, Min, SafeReciprocal
+from .formula import simplified_sum, simplified_product, Compiler, compile_formulas
+
+
+def test_compile():
+    credence_history = History([
+        {1: .6, 2: .2},
+    ])
+    f = Sum(
+        Constant(1),
+        Product(Constant(-3), Price(1, 1)),
+        Max(Price(1, 1), Price(2, 1)),
+        Min(Price(1, 1), Price(2, 1)),
+        SafeReciprocal(Product(Constant(4), Price(1, 1))))
+    assert f.compile()(credence_history) == f.evaluate(credence_history)
+
+
+def test_compile_shares_equal_subformulas():
+    compiler = Compiler()
+    a = Sum(Constant(1), Price(1, 1))
+    b = Sum(Constant(1), Price(1, 1))
+    assert compiler.value(a) == compiler.value(b)
+    assert compiler.value(Constant(-0.)) != compiler.value(Constant(0.))
+    assert compiler.value(Price(1, 1)) != compiler.value(Price(2, 1))
+
+
+def test_compile_with_fixed_updates():
+    credence_history = History([{1: .25}])
+    f = Sum(Product(Constant(2.), Price(1, 1)), Price(1, 2))
+    evaluate_all = compile_formulas([f, Price(1, 1)], credence_history)
+    for credence in [0., .5, 1.]:
+        next_history = credence_history.with_next_update({1: credence})
+        assert evaluate_all(next_history) == [f.evaluate(next_history), .25]
+
+    # the product only looks at the first update, so it is evaluated up front
+    # on credence_history, and a different first update is never looked at
+    other_history = History([{1: .75}, {1: .5}])
+    assert evaluate_all(other_history) == [2. * .25 + .5, .25]
+
+
+def test_simplified_sum():
+    x = Price(1, 1)
+    assert simplified_sum(Constant(0), x) is x
+    assert simplified_sum(Constant(0)).k == 0
+    assert len(simplified_sum(x, Constant(0), x).terms) == 2
+
+
+def test_simplified_product():
+    x = Price(1, 1)
+    assert simplified_product(Constant(1), x) is x
+    assert simplified_product(x, Constant(0), x).k == 0
+    assert len(simplified_product(Constant(2), Constant(1), x).terms) == 2
+
+
+def test_simplified_product_keeps_domain():
+    x = Price(1, 1)
+    zero = simplified_product(Constant(0), x)
+    assert zero.k == 0
+    assert zero.domain() == {1}
+    assert simplified_sum(zero, Price(2, 1)).domain() == {1, 2}
+    assert simplified_sum(Constant(0), x) is x
+
+
+def test_empty_product():
+    credence_history = History([{}])
+    assert Product().evaluate(credence_history) == 1
+    assert Product().compile()(credence_history) == 1
@@ -1,19 +1,19 @@
 import itertools
 import collections
 import math
+from fractions import Fraction
 
 from . import enumerator
 from . import formula
 from . import credence
+from .sentence import atom_truth_tables
 
 
 def union(sequences):
     """Compute the union of a sequence of sequences."""
-    sets = list(set(seq) for seq in sequences)
-    if len(sets) == 0:
-        return set()
-    else:
-        return set.union(*(x for x in sets))
+    # stream the elements of every sequence into a single set, rather than
+    # building an intermediate set for each one
+    return set(itertools.chain.from_iterable(sequences))
 
 
 def evaluate(trading_policy, credence_history, world) -> float:
@@ -21,16 +21,90 @@ def evaluate(trading_policy, credence_history, world) -> float:
     Compute the value of the trades executed by trading_policy in the given
     world.
     """
-    value_of_holdings = 0
+    return value_of_trades(executed_trades(trading_policy, credence_history), world)
+
+
+def executed_trades(trading_policy, credence_history):
+    """
+    Compute the trades executed by trading_policy as a list of (sentence,
+    value_if_true, value_if_false) tuples, which give the value of the tokens
+    purchased for each sentence when it turns out to be true or false. These do
+    not depend on the world, so they can be computed once and then valued in
+    many worlds with value_of_trades. Sentences for which no tokens are
+    purchased are left out, since they add nothing to the value in any world.
+    """
+    trades = []
     for sentence, formula in trading_policy.items():
         # compute the quantity of tokens purchased for this sentence 
         quantity = formula.evaluate(credence_history)
+        if quantity == 0:
+            continue
         # compute the price paid for those tokens
         price = credence_history.price(sentence)
-        # compute the value of these tokens in the given world
-        payout = float(world[sentence])
-        # add the profit or loss to the net value
-        value_of_holdings += quantity * (payout - price)
+        trades.append(trade_values(sentence, quantity, price))
+    return trades
+
+
+def trade_values(sentence, quantity, price):
+    """
+    Compute the profit or loss from purchasing the given quantity of tokens for
+    sentence at the given price, in the worlds where the sentence is true and
+    where it is false.
+    """
+    # the tokens pay out $1 if the sentence is true and $0 if it is false
+    return (sentence, quantity * (1. - price), quantity * (0. - price))
+
+
+def compile_policy(trading_policy, credence_history=None):
+    """
+    Compile the formulas in trading_policy, returning a function that
+    computes the same trades as executed_trades for a given credence history.
+    If credence_history is given then the function may only be called on
+    histories that extend it, as for formula.compile_formulas.
+    """
+    sentences = list(trading_policy.keys())
+    quantities = formula.compile_formulas(trading_policy.values(), credence_history)
+    def trades(credence_history):
+        if len(sentences) == 0:
+            return []
+        # the price of each sentence is its credence on the latest update, so
+        # look that update up once rather than once per sentence
+        prices = credence_history.last_update()
+        return [
+            trade_values(sentence, quantity, prices.get(sentence, 0.))
+            for sentence, quantity in zip(sentences, quantities(credence_history))
+            if quantity != 0
+        ]
+    return trades
+
+
+def value_of_trades(trades, world) -> float:
+    """
+    Compute the value in the given world of a list of trades from
+    executed_trades.
+    """
+    # this is evaluated for every trade in every world, so it only picks
+    # between the two values computed up front in executed_trades
+    value_of_holdings = 0
+    for sentence, value_if_true, value_if_false in trades:
+        value_of_holdings += value_if_true if world[sentence] else value_if_false
+
+    return value_of_holdings
+
+
+def max_value_of_trades(trades) -> float:
+    """
+    Compute the greatest value of a list of trades from executed_trades over
+    all worlds, where a world is any assignment of truth values to the
+    sentences traded on.
+    """
+    # the value of holdings is a sum of one term per sentence, and each term
+    # depends only on the truth value of its own sentence, so the best world
+    # for the trader is found by picking the better truth value for each
+    # sentence independently, rather than by enumerating all 2^n worlds
+    value_of_holdings = 0
+    for sentence, value_if_true, value_if_false in trades:
+        value_of_holdings += max(value_if_true, value_if_false)
 
     return value_of_holdings
 
@@ -40,13 +114,54 @@ def rational_credences(sentences):
     Enumerates all rational-valued credences over a set of sentences
     """
     for cs in enumerator.product(enumerator.rationals_between(0, 1), len(sentences)):
-        yield {sentence: credence for sentence, credence in zip(sentences, cs)}
+        yield dict(zip(sentences, cs))
 
 
-def find_credences(trading_policy, credence_history, tolerance, credence_search_order=None):
+def dyadic_credences(sentences):
+    """
+    Enumerates credences over a set of sentences on successively finer grids,
+    with spacing 1/2, 1/4, 1/8, ... between points. Every grid contains the
+    previous one, so each level only yields the points that are new to it.
+    This reaches a given precision after far fewer candidates than
+    rational_credences, but only yields credences whose denominators are
+    powers of two, so it will not find exact solutions such as 1/3.
+    """
+    sentences = list(sentences)
+    if len(sentences) == 0:
+        yield {}
+        return
+
+    for level in enumerator.integers():
+        denom = 2 ** level
+        grid = [Fraction(numer, denom) for numer in range(denom+1)]
+        for numers in itertools.product(range(denom+1), repeat=len(sentences)):
+            # a point where every numerator is even was yielded at a coarser level
+            if level > 0 and all(numer % 2 == 0 for numer in numers):
+                continue
+            yield {sentence: grid[numer] for sentence, numer in zip(sentences, numers)}
+
+
+def float_credences(credences):
+    """
+    Convert a set of credences to floats. Trading formulas are mostly built
+    from float constants, and mixing those with Fractions is many times slower
+    than float arithmetic, so find_credences can convert credences before
+    formulas are evaluated on them.
+    """
+    return {sentence: float(c) for sentence, c in credences.items()}
+
+
+def find_credences(trading_policy, credence_history, tolerance, credence_search_order=None, exact=True):
     """
     Find a set of credences such that the value-of-holdings for the trades
     executed by trading_policy are not greater than tolerance in any world.
+
+    If exact is False then each candidate is first priced with every credence
+    converted to a float, which is much faster, and only the candidates that
+    pass are priced again with the credences as given. The answer is then
+    never one that the exact search would reject, but rounding can make the
+    float check reject a candidate that the exact search would accept, so the
+    two may return different credences.
     """
 
     # if no search order specified then brute force all rational-valued credences
@@ -59,23 +174,36 @@ def find_credences(trading_policy, credence_history, tolerance, credence_search_
     # compute the set of sentences over which we should search for credences
     search_domain = union(formula.domain() for formula in trading_policy.values()).union(support)
 
+    # the trading formulas are evaluated once per candidate below, so compile
+    # them up front, which also evaluates once any parts of them that only look
+    # at past updates, since those are the same for every candidate
+    trades_on = compile_policy(trading_policy, credence_history)
+
+    # every candidate is priced against the same history extended by one
+    # update, so build that history once and swap each candidate into it
+    history = credence_history.with_scratch_update()
+
+    if not exact:
+        float_history = credence_history.converted(float_credences)
+        float_trades_on = compile_policy(trading_policy, float_history)
+        float_scratch_history = float_history.with_scratch_update()
+
     # brute force search over all rational-valued credences between 0 and 1
     for credences in credence_search_order(search_domain):          # link: search_over_credences
-        history = credence_history.with_next_update(credences)
+        if not exact:
+            float_scratch_history.replace_last_update(float_credences(credences))
+            if max_value_of_trades(float_trades_on(float_scratch_history)) > tolerance:
+                continue
 
-        # check all possible worlds (all possible truth values for the support sentences)
-        satisfied = True
-        for truth_values in itertools.product([0, 1], repeat=len(support)):     # link: max_over_worlds
-            world = {sentence: truth for sentence, truth in zip(support, truth_values)}
-            value_of_holdings = evaluate(trading_policy, history, world)
+        history.replace_last_update(credences)
 
-            # there might not be any way to prevent our traders from losing money,
-            # so there is no abs() in the below
-            if value_of_holdings > tolerance:                         # link: tolerance_check
-                satisfied = False
-                break
+        # find the value of holdings in the world that is best for the trader
+        # (the max over all possible truth values for the support sentences)
+        value_of_holdings = max_value_of_trades(trades_on(history))     # link: max_over_worlds
 
-        if satisfied:
+        # there might not be any way to prevent our traders from losing money,
+        # so there is no abs() in the below
+        if value_of_holdings <= tolerance:                               # link: tolerance_check
             return credences
 
 
@@ -93,13 +221,115 @@ def worlds_consistent_with(observations, domain):
     
     observations is a list of sentences
     """
+    domain = list(domain)
+    for truth_values in truth_vectors_consistent_with(observations, domain):
+        yield dict(zip(domain, truth_values))
+
+
+def truth_vectors_consistent_with(observations, domain):
+    """
+    Enumerate the same worlds as worlds_consistent_with, but represent each
+    world as a tuple of truth values parallel to domain, which must be a list.
+    """
+    observation_tables, domain_tables, everything = truth_tables(observations, domain)
+    consistent = everything
+    for table in observation_tables:
+        consistent &= table
+
+    domain_bits = [bit_string(table, everything) for table in domain_tables]
+    for i in set_bits(consistent):
+        yield tuple([bits[i] == "1" for bits in domain_bits])
+
+
+def truth_vectors_by_prefix(observations, domain):
+    """
+    Enumerate the worlds consistent with at least the first of a list of
+    observations, as pairs (truth_values, n) where truth_values is as for
+    truth_vectors_consistent_with and n is the number of observations at the
+    start of the list that the world is consistent with. This visits each world
+    once, rather than once for each prefix of the observations that it is
+    consistent with.
+    """
+    observation_tables, domain_tables, everything = truth_tables(observations, domain)
+
+    # the worlds consistent with each prefix of the observations, which shrink
+    # as the prefixes get longer
+    prefix_tables = []
+    consistent = everything
+    for table in observation_tables:
+        consistent &= table
+        prefix_tables.append(consistent)
+    prefix_tables.append(0)
+
+    domain_bits = [bit_string(table, everything) for table in domain_tables]
+    for n in range(1, len(observations)+1):
+        # the worlds consistent with the first n observations but not the first n+1
+        for i in set_bits(prefix_tables[n-1] & ~prefix_tables[n]):
+            yield tuple([bits[i] == "1" for bits in domain_bits]), n
+
+
+def truth_tables(observations, domain):
+    """
+    Compute truth tables for the observations and for the sentences in domain
+    over all assignments of truth values to the atoms they contain. A truth
+    table is an integer in which the i-th bit is the truth value of a sentence in
+    the i-th world. Returns the tables for the observations and the domain,
+    together with the table that is true in every world.
+    """
     domain_atoms = union(sentence.atoms() for sentence in domain)
     observation_atoms = union(sentence.atoms() for sentence in observations)
     atoms = sorted(set.union(domain_atoms, observation_atoms))
-    for truth_values in itertools.product((True, False), repeat=len(atoms)):
-        base_facts = {atom: value for atom, value in zip(atoms, truth_values)}
-        if all(sentence.evaluate(base_facts) for sentence in observations):
-            yield {sentence: sentence.evaluate(base_facts) for sentence in domain}
+
+    columns, everything = atom_truth_tables(atoms)
+    observation_tables = [sentence.truth_table(columns, everything) for sentence in observations]
+    domain_tables = [sentence.truth_table(columns, everything) for sentence in domain]
+    return observation_tables, domain_tables, everything
+
+
+def bit_string(table, everything):
+    """
+    Convert a truth table to a string of "0" and "1" characters in which the
+    i-th character is the truth value in the i-th world. Indexing this string
+    takes constant time, whereas shifting a large truth table to get at one bit
+    takes time proportional to the number of worlds.
+    """
+    return format(table, "0{}b".format(everything.bit_length()))[::-1]
+
+
+def set_bits(table):
+    """Enumerate the indices of the set bits in an integer, from lowest to highest."""
+    for i, bit in enumerate(format(table, "b")[::-1]):
+        if bit == "1":
+            yield i
+
+
+def cached_worlds(world_cache, enumerate_worlds, observations, domain):
+    """
+    Call enumerate_worlds(observations, domain), which is one of the functions
+    above, and return the distinct worlds it enumerates as a list, in the order
+    they were first enumerated. If world_cache is a dict then look the list up
+    there first, and store it there if it is new.
+    """
+    if world_cache is None:
+        return distinct_worlds(enumerate_worlds(observations, domain))
+
+    key = (enumerate_worlds, tuple(observations), tuple(domain))
+    worlds = world_cache.get(key)
+    if worlds is None:
+        worlds = distinct_worlds(enumerate_worlds(observations, domain))
+        world_cache[key] = worlds
+    return worlds
+
+
+def distinct_worlds(worlds):
+    """
+    Remove repeated worlds from a sequence, keeping the first occurrence of
+    each. The worlds are enumerated over assignments to atoms, so when the
+    domain contains compound sentences, or does not contain every atom, many
+    assignments give the same truth values to the domain. Budget computations
+    take mins and maxes over worlds, so the repeats add work but change nothing.
+    """
+    return list(dict.fromkeys(worlds))
 
 
 def compute_budget_factor(
@@ -129,71 +359,105 @@ def compute_budget_factor(
     credences when computing the budget factor because the budget factor is an
     input to the process by which the logical inductor updates its credences.
     """
-    assert budget > 0
-
-    history_length = len(observation_history)
+    table = compute_budget_table(
+        observation_history,
+        next_observation,
+        trading_history,
+        next_trading_policy,
+        credence_history)
+    return budget_factor_from_table(budget, table)
 
-    # compute the support for all trading formulas over all days
-    support = union(set(trading_policy.keys()) for trading_policy in trading_history)
 
-    # evaluate the "if" clause in (5.2.1)
-    for i in range(history_length):
-        observations_up_to_i = set(observation_history[:i+1])
+class BudgetTable(object):
+    """
+    The part of a budget factor computation that does not depend on the
+    budget, which is computed by compute_budget_table and can be reused for
+    many budgets by budget_factor_from_table.
+    """
+    def __init__(self, lowest_accumulated_value, worlds):
+        # the lowest value of holdings reached on any past update in any world
+        # consistent with the observations up to that update
+        self.lowest_accumulated_value = lowest_accumulated_value
+        # a list of (accumulated_value, neg_value_of_holdings) pairs, one for
+        # each world consistent with all observations
+        self.worlds = worlds
 
-        # go over the worlds consistent with the first N observations
-        for world in worlds_consistent_with(observations_up_to_i, support):
 
-            # calculate the accumulated value of the trader up to update N
-            accumulated_value = 0
-            for cur_trading_policy in trading_history[:i+1]:
-                accumulated_value += evaluate(cur_trading_policy, credence_history, world)
+def compute_budget_table(
+    observation_history,
+    next_observation,
+    trading_history,
+    next_trading_policy,
+    credence_history,
+    world_cache=None):
+    """
+    Compute the part of compute_budget_factor that does not depend on the
+    budget. The arguments are as for compute_budget_factor. If world_cache is
+    a dict then the worlds enumerated here are stored in it, and reused by
+    later calls with the same observations and support.
+    """
+    history_length = len(observation_history)
 
-                # if we have exceeded our budget on a previous update then we
-                # have no more money to trade now
-                if accumulated_value < -budget + 1e-7:
-                    return formula.Constant(0)
+    # compute the support for all trading formulas over all days
+    past_support = union(trading_policy.keys() for trading_policy in trading_history)
+
+    # add atoms for next_trading_formula to the support set, after the support
+    # for past days so that the sentences in past_support come first
+    support = list(past_support)
+    support.extend(set(next_trading_policy.keys()) - past_support)
+
+    # number the sentences in the support, so that each world below can be a
+    # tuple of truth values indexed by these numbers rather than a dict
+    index = {sentence: i for i, sentence in enumerate(support)}
+
+    # the trades executed on past days do not depend on the world, so compute
+    # them once here rather than once per world below
+    trades_history = [
+        [(index[sentence], value_if_true, value_if_false)
+         for sentence, value_if_true, value_if_false in executed_trades(trading_policy, credence_history)]
+        for trading_policy in trading_history
+    ]
+
+    # evaluate the "if" clause in (5.2.1), which checks whether the
+    # accumulated value ever fell below the budget in any world consistent with
+    # the first N observations, for each N. Each world is consistent with the
+    # first N observations up to some point, so visit each world once and
+    # check the accumulated value after each of those N.
+    lowest_accumulated_value = math.inf
+    prefix_worlds = cached_worlds(world_cache, truth_vectors_by_prefix, observation_history, support[:len(past_support)])
+    for world, num_consistent in prefix_worlds:
+        # calculate the accumulated value of the trader up to update N
+        accumulated_value = 0
+        for trades in itertools.islice(trades_history, num_consistent):
+            accumulated_value += value_of_trades(trades, world)
+            lowest_accumulated_value = min(lowest_accumulated_value, accumulated_value)
 
     # create a set of observations up to and including the most recent
     observations = set(observation_history)
     observations.add(next_observation)
 
-    # add atoms for next_trading_formula to the support set
-    support.update(set(next_trading_policy.keys()))
-
-    # if we got this far then we have not already exceeded our budget, so now
-    # compute the budget factor
-    budget_divisors = []
-    for world in worlds_consistent_with(observations, support):     # link: loop_over_consistent_worlds
-        # compute our accumulated value in this world
-        accumulated_value = 0
-        for cur_trading_policy in trading_history:
-            accumulated_value += evaluate(cur_trading_policy, credence_history, world)
-
-        # the money we have left to trade now is our original budget, plus
-        # (resp. minus) any money we made (resp. lost) since the beginning of
-        # time
-        remaining_budget = budget + accumulated_value
+    # the value of next_trading_policy in a world depends only on the truth
+    # value of each sentence in that world, so construct the terms for both
+    # truth values once here, rather than once per world
+    next_value_terms = []
+    for sentence, trading_formula in next_trading_policy.items():
+        # a sentence that is not traded adds nothing to the value in any world
+        if formula.is_constant(trading_formula, 0):
+            continue
 
-        # this value should be positive given the check that we did above
-        assert remaining_budget > 1e-8
-        remaining_budget_recip = 1. / remaining_budget
-
-        # construct a trading formula representing the value of
-        # next_trading_policy in this world, as a function of the
-        # yet-to-be-determined credences for the latest update
-        value_of_holdings_terms = []
-        for sentence, trading_formula in next_trading_policy.items():
-            # construct a trading formula that looks up the price of tokens for this sentence
-            price = formula.Price(sentence, history_length+1)
+        # construct a trading formula that looks up the price of tokens for this sentence
+        price = formula.Price(sentence, history_length+1)
 
+        terms_by_truth_value = []
+        for truth_value in (False, True):
             # construct a trading formula that computes the value that this
-            # sentence pays out in this world
-            payout = formula.Constant(float(world[sentence]))
+            # sentence pays out in worlds where it has this truth value
+            payout = formula.Constant(float(truth_value))
 
             # construct a trading formula that computes the net value of
             # purchasing one token of this sentence, which is the payout from the
             # token minus the price paid to purchase the token
-            value = formula.Sum(
+            value = formula.simplified_sum(
                 payout,
                 formula.Product(
                     formula.Constant(-1),
@@ -201,19 +465,67 @@ def compute_budget_factor(
 
             # construct a trading formula that multiplies the number of tokens that we
             # purchase by their profitability
-            value_of_holdings_terms.append(formula.Product(
+            terms_by_truth_value.append(formula.simplified_product(
                 trading_formula,
                 value))
 
+        next_value_terms.append((index[sentence], terms_by_truth_value))
+
+    worlds = []
+    consistent_worlds = cached_worlds(world_cache, truth_vectors_consistent_with, observations, support)
+    for world in consistent_worlds:     # link: loop_over_consistent_worlds
+        # compute our accumulated value in this world
+        accumulated_value = 0
+        for trades in trades_history:
+            accumulated_value += value_of_trades(trades, world)
+
+        # pick out the trading formulas representing the value of
+        # next_trading_policy in this world, as a function of the
+        # yet-to-be-determined credences for the latest update
+        value_of_holdings_terms = [
+            terms_by_truth_value[world[i]]
+            for i, terms_by_truth_value in next_value_terms
+        ]
+
         # construct a trading formula representing the value of the trades
         # executed on this update in this world
-        value_of_holdings = formula.Sum(*value_of_holdings_terms)
+        value_of_holdings = formula.simplified_sum(*value_of_holdings_terms)
 
         # construct a trading formula representing the negation of the above
-        neg_value_of_holdings = formula.Product(
+        neg_value_of_holdings = formula.simplified_product(
             formula.Constant(-1),
             value_of_holdings)
 
+        worlds.append((accumulated_value, neg_value_of_holdings))
+
+    return BudgetTable(lowest_accumulated_value, worlds)
+
+
+def budget_factor_from_table(budget, table):
+    """
+    Compute the budget factor for the given budget from a BudgetTable, as
+    described in compute_budget_factor.
+    """
+    assert budget > 0
+
+    # if we have exceeded our budget on a previous update then we have no more
+    # money to trade now
+    if table.lowest_accumulated_value < -budget + 1e-7:
+        return formula.Constant(0)
+
+    # if we got this far then we have not already exceeded our budget, so now
+    # compute the budget factor
+    budget_divisors = []
+    for accumulated_value, neg_value_of_holdings in table.worlds:
+        # the money we have left to trade now is our original budget, plus
+        # (resp. minus) any money we made (resp. lost) since the beginning of
+        # time
+        remaining_budget = budget + accumulated_value
+
+        # this value should be positive given the check that we did above
+        assert remaining_budget > 1e-8
+        remaining_budget_recip = 1. / remaining_budget
+
         # construct a trading formula representing the value we would need to
         # divide our trades by in this world in order to make sure we do not
         # exceed our remaining budget
@@ -252,6 +564,76 @@ def compute_budget_factor(
     # not for min.
 
 
+def budgeted_terms(k, trading_history, observation_history, credence_history, world_cache=None):
+    """
+    Compute the terms that the k-th trading algorithm contributes to the
+    trading formula returned by combine_trading_algorithms, as a list of
+    (sentence, formula) pairs. The arguments are as for
+    combine_trading_algorithms, except that trading_history is the history of
+    the k-th trading algorithm alone. The terms for each trading algorithm do
+    not depend on the others, except that they may share a world_cache as
+    described in compute_budget_table.
+    """
+    # zero out the first k entries
+    clipped_trading_history = [{} for i in range(k)] + trading_history[k:]
+
+    # every term below multiplies a formula from the latest trading policy, so
+    # if that policy is empty there are no terms and nothing to budget for
+    if len(clipped_trading_history[-1]) == 0:
+        return []
+
+    # compute an upper bound on the net value for this trading history
+    net_value_bound = 0
+    for trading_policy in clipped_trading_history:
+        for sentence, trading_expr in trading_policy.items():
+            # compute an upper bound on the absolute value of trading_expr,
+            # which is the quantity that we will purchase of this sentence
+            quantity_bound = trading_expr.bound()
+
+            # Let C = quantity_bound. We might spend up to $C purchasing
+            # these tokens, and they might later be worth up to $C, so their
+            # net value could be between -$C and $2C. We technically only
+            # need a lower bound for the sum below but here we follow the
+            # paper and compute a formal bound on the net value of this
+            # trade by including the constant 2 below. See the last
+            # paragraph of proof of 5.3.2 in the paper.
+            net_value_bound += 2 * quantity_bound
+
+    net_value_bound = math.ceil(net_value_bound)
+
+    # TODO: we can compute a better bound by using the N-1 belief states
+    # that we have already observed in credence_history
+
+    # the worlds and the value accumulated in each of them are the same for
+    # every budget, so compute them once for this trading history
+    budget_table = compute_budget_table(
+        observation_history[:-1],
+        observation_history[-1],
+        clipped_trading_history[:-1],
+        clipped_trading_history[-1],
+        credence_history,
+        world_cache)
+
+    terms = []
+    for budget in range(1, net_value_bound+1):          # link: loop_over_columns
+        budget_factor = budget_factor_from_table(budget, budget_table)
+
+        for sentence, trading_expr in clipped_trading_history[-1].items():
+            weight = 2 ** (-k-1 - budget)
+            terms.append((sentence, formula.simplified_product(      # link: apply_budget_transform
+                formula.Constant(weight),
+                budget_factor,
+                trading_expr)))
+
+    for sentence, trading_expr in clipped_trading_history[-1].items():
+        weight = 2 ** (-k-1 - net_value_bound)
+        terms.append((sentence, formula.simplified_product(
+            formula.Constant(weight),
+            trading_expr)))
+
+    return terms
+
+
 def combine_trading_algorithms(trading_histories, observation_history, credence_history):
     """
     Given:
@@ -273,68 +655,25 @@ def combine_trading_algorithms(trading_histories, observation_history, credence_
     # compute the terms that should be added together to produce the final
     # trading formula
     terms_by_sentence = collections.defaultdict(list)
-    for k, trading_history in enumerate(trading_histories):  # link: loop_over_rows
-        # zero out the first k entries
-        clipped_trading_history = []
-        for i, trading_policy in enumerate(trading_history):
-            if i < k:
-                clipped_trading_history.append({})
-            else:
-                clipped_trading_history.append(trading_policy)
-
-        # compute an upper bound on the net value for this trading history
-        net_value_bound = 0
-        for trading_policy in clipped_trading_history:
-            for sentence, trading_expr in trading_policy.items():
-                # compute an upper bound on the absolute value of trading_expr,
-                # which is the quantity that we will purchase of this sentence
-                quantity_bound = trading_expr.bound()
-
-                # Let C = quantity_bound. We might spend up to $C purchasing
-                # these tokens, and they might later be worth up to $C, so their
-                # net value could be between -$C and $2C. We technically only
-                # need a lower bound for the sum below but here we follow the
-                # paper and compute a formal bound on the net value of this
-                # trade by including the constant 2 below. See the last
-                # paragraph of proof of 5.3.2 in the paper.
-                net_value_bound += 2 * quantity_bound
-
-        net_value_bound = math.ceil(net_value_bound)
-
-        # TODO: we can compute a better bound by using the N-1 belief states
-        # that we have already observed in credence_history
-
-        for budget in range(1, net_value_bound+1):          # link: loop_over_columns
-            budget_factor = compute_budget_factor(
-                budget,
-                observation_history[:-1],
-                observation_history[-1],
-                clipped_trading_history[:-1],
-                clipped_trading_history[-1],
-                credence_history)
-
-            for sentence, trading_expr in clipped_trading_history[-1].items():
-                weight = 2 ** (-k-1 - budget)
-                terms_by_sentence[sentence].append(formula.Product(         # link: apply_budget_transform
-                    formula.Constant(weight),
-                    budget_factor,
-                    trading_expr))
 
-        for sentence, trading_expr in clipped_trading_history[-1].items():
-            weight = 2 ** (-k-1 - net_value_bound)
-            terms_by_sentence[sentence].append(formula.Product(
-                formula.Constant(weight),
-                trading_expr))
+    # the observations are the same for every trading algorithm, and often so
+    # are the sentences that they trade on, so share the enumerated worlds
+    world_cache = {}
+    for k, trading_history in enumerate(trading_histories):  # link: loop_over_rows
+        for sentence, term in budgeted_terms(k, trading_history, observation_history, credence_history, world_cache):
+            terms_by_sentence[sentence].append(term)
 
     # create a trading policy by summing over the terms above
     return {
-        sentence: formula.Sum(*terms)
+        sentence: formula.simplified_sum(*terms)
         for sentence, terms in terms_by_sentence.items()
     }
 
 
 class LogicalInductor(object):
-    def __init__(self):
+    def __init__(self, exact=True):
+        # passed on to find_credences
+        self._exact = exact
         self._trading_algorithms = []
         self._trading_histories = []
         self._observation_history = []
@@ -379,7 +718,8 @@ class LogicalInductor(object):
             ensemble_policy,
             self._credence_history,
             tolerance,
-            search_order)
+            search_order,
+            self._exact)
 
         # add these credences to the history
         self._credence_history = self._credence_history.with_next_update(credences)
@@ -1,8 +1,12 @@
 from .credence import History
 from .formula import Price, Sum, Constant, Product, Max, SafeReciprocal
-from .sentence import Atom, Disjunction, Negation
-from .inductor import evaluate, find_credences, compute_budget_factor, combine_trading_algorithms, LogicalInductor
+import itertools
+
+from .sentence import Atom, Disjunction, Negation, Implication
+from .inductor import evaluate, executed_trades, compile_policy, max_value_of_trades, find_credences, dyadic_credences, compute_budget_factor, combine_trading_algorithms, LogicalInductor
+from .inductor import truth_vectors_consistent_with, truth_vectors_by_prefix, cached_worlds, distinct_worlds, budgeted_terms
 from .enumerator import integers
+from fractions import Fraction
 
 
 def print_formulas(trading_formulas):
@@ -28,6 +32,23 @@ def test_evaluate():
     assert value == expected_value
 
 
+def test_max_value_of_trades():
+    credence_history = History([
+        {1: .6, 2: .3},
+    ])
+    trading_formulas = {
+        1: Price(1, 1),                         # buy 0.6 tokens of sentence 1 at price 0.6
+        2: Product(Constant(-2), Price(2, 1)),  # sell 0.6 tokens of sentence 2 at price 0.3
+    }
+    # the best world for this trader is one where sentence 1 is true and sentence 2 is false
+    worlds = [{1: a, 2: b} for a in (0, 1) for b in (0, 1)]
+    expected_value = max(evaluate(trading_formulas, credence_history, world) for world in worlds)
+    trades = executed_trades(trading_formulas, credence_history)
+    assert compile_policy(trading_formulas)(credence_history) == trades
+    assert abs(max_value_of_trades(trades) - expected_value) < 1e-12
+    assert abs(expected_value - (.6 * (1 - .6) + -.6 * (0 - .3))) < 1e-12
+
+
 def test_find_credences_trivial():
     credence_history = History([])  # empty history
     trading_formulas = {
@@ -54,6 +75,24 @@ def test_find_credences_single():
     assert abs(new_credences[1] - 1/3) < 1e-8
 
 
+def test_find_credences_dyadic():
+    credence_history = History([])  # empty history
+    trading_formulas = {
+        # purchase sentence 1 in quantity 1 - 3 * credence
+        1: Sum(
+            Constant(1),
+            Product(
+                Constant(-3),
+                Price(1, 1))),
+    }
+
+    new_credences = find_credences(trading_formulas, credence_history, 1e-3, dyadic_credences)
+
+    # 1/3 is not on any dyadic grid, but a fine enough grid gets close to it
+    assert abs(new_credences[1] - 1/3) < 1e-3
+    assert new_credences[1].denominator & (new_credences[1].denominator - 1) == 0
+
+
 def test_find_credences_multiple():
     credence_history = History([])  # empty history; we are on the first update
     trading_formulas = {
@@ -80,6 +119,29 @@ def test_find_credences_multiple():
     assert abs(new_credences[2] - 0) < 1e-8
 
 
+def test_find_credences_inexact():
+    credence_history = History([])  # empty history
+    trading_formulas = {
+        # purchase sentence 1 in quantity credence-of-sentence-2 times credence-of-sentence-3
+        1: Product(Price(2, 1), Price(3, 1)),
+    }
+
+    # the first candidate is exploitable by exactly 1/5, but in floats 1/3 times
+    # 3/5 rounds to just under 1/5, so it only passes the float check
+    candidates = [
+        {1: Fraction(0), 2: Fraction(1, 3), 3: Fraction(3, 5)},
+        {1: Fraction(0), 2: Fraction(0), 3: Fraction(0)},
+    ]
+    tolerance = float(Fraction(1, 3)) * float(Fraction(3, 5))
+    assert tolerance < 1/5
+
+    new_credences = find_credences(trading_formulas, credence_history, tolerance, lambda domain: candidates)
+    assert new_credences is candidates[1]
+
+    new_credences = find_credences(trading_formulas, credence_history, tolerance, lambda domain: candidates, exact=False)
+    assert new_credences is candidates[1]
+
+
 def test_compute_budget_factor_simple():
     phi = Atom("ϕ")
 
@@ -240,6 +302,107 @@ def test_compute_budget_factor_already_overran_budget():
     assert budget_factor.k == 0
 
 
+def enumerate_worlds(observations, domain):
+    """Enumerate the worlds consistent with observations by brute force, with
+    one truth vector over domain for every assignment of truth values to the
+    atoms, which is how worlds were enumerated before truth tables."""
+    atoms = sorted(set().union(*(s.atoms() for s in list(observations) + list(domain))))
+    for values in itertools.product((True, False), repeat=len(atoms)):
+        base_facts = dict(zip(atoms, values))
+        if all(s.evaluate(base_facts) for s in observations):
+            yield tuple(s.evaluate(base_facts) for s in domain)
+
+
+def test_truth_vectors_by_prefix():
+    a = Atom("a")
+    b = Atom("b")
+    c = Atom("c")
+    observations = [Disjunction(a, b), Negation(a), Implication(b, c)]
+
+    # b is not in the domain and a | c is compound, so many assignments to the
+    # atoms project to the same truth vector
+    domain = [a, Disjunction(a, c)]
+
+    assert list(truth_vectors_consistent_with(observations, domain)) == list(enumerate_worlds(observations, domain))
+
+    by_prefix = list(truth_vectors_by_prefix(observations, domain))
+    assert len(distinct_worlds(by_prefix)) < len(by_prefix)
+    for n in range(1, len(observations)+1):
+        # the worlds consistent with the first n observations are those whose
+        # prefix is at least n long, repeats included
+        expected = list(enumerate_worlds(observations[:n], domain))
+        actual = [world for world, prefix in by_prefix if prefix >= n]
+        assert sorted(actual) == sorted(expected)
+    assert all(prefix >= 1 for world, prefix in by_prefix)
+
+
+def test_cached_worlds():
+    a = Atom("a")
+    b = Atom("b")
+    observations = [Disjunction(a, b)]
+    domain = [Disjunction(a, b), b]
+
+    expected = list(dict.fromkeys(enumerate_worlds(observations, domain)))
+    assert cached_worlds(None, truth_vectors_consistent_with, observations, domain) == expected
+
+    world_cache = {}
+    worlds = cached_worlds(world_cache, truth_vectors_consistent_with, observations, domain)
+    assert worlds == expected
+    assert cached_worlds(world_cache, truth_vectors_consistent_with, observations, domain) is worlds
+
+    # a different domain or enumeration gets its own entry
+    assert cached_worlds(world_cache, truth_vectors_consistent_with, observations, [a]) == [(True,), (False,)]
+    assert cached_worlds(world_cache, truth_vectors_by_prefix, observations, domain) != worlds
+    assert len(world_cache) == 3
+
+
+def test_combine_trading_algorithms_shares_worlds():
+    phi = Atom("ϕ")
+    psi = Atom("Ψ")
+
+    # two trading algorithms that trade on the same sentence, so their budget
+    # tables enumerate the same worlds, which combine_trading_algorithms shares
+    trading_histories = [
+        [{phi: Constant(1)}, {phi: Product(Constant(2), Price(psi, 2))}],
+        [{}, {phi: Constant(-1), psi: Price(phi, 1)}],
+    ]
+    observation_history = [Disjunction(phi, psi), psi]
+    credence_history = History([{phi: .25, psi: .5}])
+
+    combined = combine_trading_algorithms(trading_histories, observation_history, credence_history)
+
+    # compute each algorithm's terms with no shared worlds
+    terms_by_sentence = {}
+    for k, trading_history in enumerate(trading_histories):
+        for sentence, term in budgeted_terms(k, trading_history, observation_history, credence_history):
+            terms_by_sentence.setdefault(sentence, []).append(term)
+
+    assert set(combined) == set(terms_by_sentence)
+    for credences in [{phi: 0., psi: 0.}, {phi: .3, psi: .9}, {phi: 1., psi: .5}]:
+        history = credence_history.with_next_update(credences)
+        for sentence, terms in terms_by_sentence.items():
+            assert combined[sentence].evaluate(history) == sum([term.evaluate(history) for term in terms])
+
+
+def test_budgeted_terms_empty_policy():
+    phi = Atom("ϕ")
+    observation_history = [phi, phi]
+    credence_history = History([{phi: .5}])
+
+    # a trading algorithm that traded on the first update but not the latest
+    # contributes no terms, and no worlds are enumerated for its budget
+    world_cache = {}
+    trading_history = [{phi: Constant(1)}, {}]
+    assert budgeted_terms(0, trading_history, observation_history, credence_history, world_cache) == []
+    assert world_cache == {}
+
+    # so it adds nothing to the combined trader
+    combined = combine_trading_algorithms([trading_history, [{}, {phi: Constant(1)}]], observation_history, credence_history)
+    alone = combine_trading_algorithms([[{}, {}], [{}, {phi: Constant(1)}]], observation_history, credence_history)
+    history = credence_history.with_next_update({phi: .25})
+    assert combined[phi].evaluate(history) == alone[phi].evaluate(history)
+
+
 def test_combine_trading_algorithms_simple():
     phi = Atom("ϕ")
     psi = Atom("Ψ")
@@ -9,15 +9,53 @@ def parenthize(sentence):
         return "(" + str(sentence) + ")"
 
 
+def atom_truth_tables(labels):
+    """
+    Compute a truth table for each atom, for use with Sentence.truth_table. The
+    worlds are numbered in the same order as itertools.product((True, False),
+    repeat=len(labels)), so the first label varies slowest.
+    """
+    num_worlds = 2 ** len(labels)
+    everything = (1 << num_worlds) - 1
+    columns = {}
+    for i, label in enumerate(labels):
+        # this atom alternates between runs of true and false worlds, each
+        # of which is this long
+        run = 2 ** (len(labels) - i - 1)
+        true_run = (1 << run) - 1
+        # repeat the pattern of one true run followed by one false run
+        columns[label] = everything // ((1 << 2*run) - 1) * true_run
+    return columns, everything
+
+
 class Sentence(ABC):
     """
     A sentence is a combination of atoms and logical connectives that evaluates
-    to true or false over a given set of base facts.
+    to true or false over a given set of base facts. Sentences are immutable, so
+    the set of atoms in a sentence is computed once and then reused.
     """
     @abstractmethod
     def evaluate(self, base_facts):
         pass
 
+    def truth_table(self, columns, everything):
+        """
+        Evaluate this sentence in many worlds at once. A truth table is an
+        integer whose i-th bit is the truth value in the i-th world. The
+        columns map each atom label to its truth table, and everything is the
+        truth table that is true in every world.
+
+        This default calls evaluate once per world. The sentences in this
+        module override it to combine the truth tables of their parts with
+        bitwise operations instead.
+        """
+        table = 0
+        for i in range(everything.bit_length()):
+            base_facts = {label: bool(column >> i & 1) for label, column in columns.items()}
+            if self.evaluate(base_facts):
+                table |= 1 << i
+        return table
+
 
 class Atom(Sentence):
     """
@@ -27,12 +65,16 @@ class Atom(Sentence):
     """
     def __init__(self, label):
         self.label = label
+        self._atoms = frozenset([label])
 
     def evaluate(self, base_facts):
         return base_facts[self.label]
 
+    def truth_table(self, columns, everything):
+        return columns[self.label]
+
     def atoms(self):
-        return {self.label}
+        return self._atoms
     
     def __str__(self):
         return self.label
@@ -51,6 +93,9 @@ class Negation(Sentence):
     def evaluate(self, base_facts):
         return not self.inner.evaluate(base_facts)
     
+    def truth_table(self, columns, everything):
+        return everything ^ self.inner.truth_table(columns, everything)
+    
     def atoms(self):
         return self.inner.atoms()
     
@@ -67,12 +112,25 @@ class Disjunction(Sentence):
     """
     def __init__(self, *disjuncts):
         self.disjuncts = disjuncts
+        self._atoms = None
     
     def evaluate(self, base_facts):
-        return any(term.evaluate(base_facts) for term in self.disjuncts)
+        # loop directly rather than passing a generator to any()
+        for term in self.disjuncts:
+            if term.evaluate(base_facts):
+                return True
+        return False
+
+    def truth_table(self, columns, everything):
+        table = 0
+        for term in self.disjuncts:
+            table |= term.truth_table(columns, everything)
+        return table
 
     def atoms(self):
-        return set.union(*(term.atoms() for term in self.disjuncts))
+        if self._atoms is None:
+            self._atoms = frozenset().union(*(term.atoms() for term in self.disjuncts))
+        return self._atoms
 
     def __str__(self):
         return " | ".join(parenthize(term) for term in self.disjuncts)
@@ -87,12 +145,24 @@ class Conjunction(Sentence):
     """
     def __init__(self, *conjuncts):
         self.conjuncts = conjuncts
+        self._atoms = None
     
     def evaluate(self, base_facts):
-        return all(term.evaluate(base_facts) for term in self.conjuncts)
+        for term in self.conjuncts:
+            if not term.evaluate(base_facts):
+                return False
+        return True
+
+    def truth_table(self, columns, everything):
+        table = everything
+        for term in self.conjuncts:
+            table &= term.truth_table(columns, everything)
+        return table
 
     def atoms(self):
-        return set.union(*(term.atoms() for term in self.conjuncts))
+        if self._atoms is None:
+            self._atoms = frozenset().union(*(term.atoms() for term in self.conjuncts))
+        return self._atoms
 
     def __str__(self):
         return " & ".join(parenthize(term) for term in self.conjuncts)
@@ -108,12 +178,19 @@ class Implication(Sentence):
     def __init__(self, antecedent, consequent):
         self.antecedent = antecedent
         self.consequent = consequent
+        self._atoms = None
     
     def evaluate(self, base_facts):
         return not self.antecedent.evaluate(base_facts) or self.consequent.evaluate(base_facts)
 
+    def truth_table(self, columns, everything):
+        antecedent = self.antecedent.truth_table(columns, everything)
+        return (everything ^ antecedent) | self.consequent.truth_table(columns, everything)
+
     def atoms(self):
-        return set.union(self.antecedent.atoms(), self.consequent.atoms())
+        if self._atoms is None:
+            self._atoms = self.antecedent.atoms().union(self.consequent.atoms())
+        return self._atoms
     
     def __str__(self):
         return "{} → {}".format(str(self.antecedent), str(self.consequent))
@@ -129,12 +206,19 @@ class Iff(Sentence):
     def __init__(self, left, right):
         self.left = left
         self.right = right
+        self._atoms = None
     
     def evaluate(self, base_facts):
         return self.left.evaluate(base_facts) == self.right.evaluate(base_facts)
 
+    def truth_table(self, columns, everything):
+        left = self.left.truth_table(columns, everything)
+        return everything ^ left ^ self.right.truth_table(columns, everything)
+
     def atoms(self):
-        return set.union(self.left.atoms(), self.right.atoms())
+        if self._atoms is None:
+            self._atoms = self.left.atoms().union(self.right.atoms())
+        return self._atoms
     
     def __str__(self):
         return "{} ⟷ {}".format(str(self.left), str(self.right))
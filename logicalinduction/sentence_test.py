@@ -1,4 +1,7 @@
-from .sentence import Atom, Negation, Conjunction
+import itertools
+
+from .sentence import Sentence, Atom, Negation, Conjunction, Disjunction, Implication, Iff, atom_truth_tables
+
 
 def test_atom():
     world = {"s1": True, "s2": False}
@@ -25,3 +28,38 @@ def test_conjunction():
     s = Conjunction(s1, s2)
     assert s.atoms() == {"s1", "s2"}
     assert not s.evaluate(world)
+
+
+def test_truth_table():
+    s1 = Atom("s1")
+    s2 = Atom("s2")
+    sentences = [
+        s1,
+        Negation(s1),
+        Conjunction(s1, s2),
+        Disjunction(s1, s2),
+        Implication(s1, s2),
+        Iff(s1, s2),
+    ]
+    columns, everything = atom_truth_tables(["s1", "s2"])
+    worlds = itertools.product((True, False), repeat=2)
+    for i, (v1, v2) in enumerate(worlds):
+        world = {"s1": v1, "s2": v2}
+        for s in sentences:
+            assert bool(s.truth_table(columns, everything) >> i & 1) == s.evaluate(world)
+
+
+def test_default_truth_table():
+    # a sentence defined outside this module that only implements evaluate
+    class Xor(Sentence):
+        def __init__(self, lhs, rhs):
+            self.lhs = lhs
+            self.rhs = rhs
+
+        def evaluate(self, base_facts):
+            return self.lhs.evaluate(base_facts) != self.rhs.evaluate(base_facts)
+
+    s1 = Atom("s1")
+    s2 = Atom("s2")
+    columns, everything = atom_truth_tables(["s1", "s2"])
+    assert Xor(s1, s2).truth_table(columns, everything) == everything ^ Iff(s1, s2).truth_table(columns, everything)
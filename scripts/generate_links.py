@@ -3,9 +3,8 @@ import os
 import argparse
 
 patterns = [
-    re.compile("^def (\w+)"),       # function pattern
-    re.compile("^class (\w+)"),     # class pattern
-    re.compile(".*# link: (\w+)")     # comment pattern
+    re.compile(r"^(?:def|class) (\w+)"),   # function or class pattern
+    re.compile(r".*# link: (\w+)")         # comment pattern
 ]
 
 html = """<!DOCTYPE html>
@@ -23,11 +22,14 @@ def main():
     parser.add_argument("--url", default="https://github.com/alexflint/logical-induction/blob/master/{}#L{}")
     args = parser.parse_args()
 
+    # map from symbol to the url of its link, where a later definition of a
+    # symbol replaces an earlier one
+    links = {}
     for path in args.sources:
         with open(path, "r") as f:
             for i, line in enumerate(f):
                 for pattern in patterns:
-                    match = re.match(pattern, line)
+                    match = pattern.match(line)
                     if not match:
                         continue
 
@@ -41,9 +43,14 @@ def main():
                     print("  "+url)
                     print()
 
-                    outpath = os.path.join(args.output, symbol + ".html")
-                    with open(outpath, "w") as out:
-                        out.write(html.format(url=url))
+                    links[symbol] = url
+
+    # write each link once, after all the sources have been scanned, rather
+    # than rewriting the file for a symbol every time it is defined
+    for symbol, url in links.items():
+        outpath = os.path.join(args.output, symbol + ".html")
+        with open(outpath, "w") as out:
+            out.write(html.format(url=url))
 
 
 if __name__ == "__main__":